@@ -1,11 +1,25 @@
 import re
+import heapq
+import math
+import mmap
 import os
-import sys
 import numpy as np
-from operator import itemgetter
 
-clean_data_objects = []
+try:
+	from numba import njit, types
+except ImportError:
+	njit = None
+
 DELIMITER = "---"
+_SKIPPED_FEELING_MESSAGE = "An error was raised when trying to extract a feeling from the input data.  This set of data will be skipped.  The error raised was: "
+_FEELING_RE = re.compile(r"\[(\w+)\]", re.ASCII)
+_WEIGHT_FOR_TIME_INTERVAL = {"Never": 0.0, "Sometimes": 1 / 3, "Often": 2 / 3, "Always": 1.0}
+_WORD_BYTES = np.frombuffer(b"NeverSometimesOftenAlways", dtype=np.uint8)
+_WORD_STARTS = np.array([0, 5, 14, 19])
+_WORD_LENGTHS = np.array([5, 9, 5, 6])
+_WORD_WEIGHTS = np.array([0.0, 1 / 3, 2 / 3, 1.0])
+_WORD_FOR_FIRST_BYTE = np.full(256, -1, dtype=np.int8)
+_WORD_FOR_FIRST_BYTE[[ord("N"), ord("S"), ord("O"), ord("A")]] = [0, 1, 2, 3]
 
 
 class Data(object):
@@ -15,10 +29,12 @@ class Data(object):
 	Attributes:
 		feeling (str): The feeling attached to the dataset.
 		data (str): The dataset.
-		weights (list): The dataset mapped to floating point numbers.
+		weights (numpy.ndarray): The dataset mapped to floating point numbers, with NaN for unmapped words.
 		average_weight (float): The average of the weights.  Everytime weights is updated, average_weight is recomputed.
 	"""
 
+	__slots__ = ("feeling", "data", "weights", "average_weight")
+
 	def __init__(self, feeling, data):
 		self.feeling = feeling
 		self.data = data
@@ -30,34 +46,89 @@ class Data(object):
 		Changes the weight attribute to new_weight.  The average weight is recomputed everytime this method is called.
 
 		Args:
-			new_weights (list): A list of floating point or integer objects.
+			new_weights (list or numpy.ndarray): A sequence of floating point or integer objects.  None and NaN entries are ignored when averaging.
 		"""
 		self.weights = new_weights
 		self.update_average_weight()
 
 	def update_average_weight(self):
 		"""
-		Calculates a new average weight.
+		Calculates a new average weight, ignoring None and NaN entries.  If there are no weights to average, the average weight is 0.0.
 		"""
-		self.average_weight = np.mean(self.weights)
+		values = [weight for weight in self.weights if weight is not None and not math.isnan(weight)]
+		self.average_weight = math.fsum(values) / len(values) if values else 0.0
 
 
 def main():
 	raw_data = get_data_from_file("EmotionalClimateData.dat", DELIMITER, 5, 15)
-	cleaned_data = clean_data(raw_data)
 
-	for data in cleaned_data:
-		populate_dataset(data[0], data[1])
+	data_objects = []
+	feelings = []
+
+	populate = _populate_dataset_fast
+	for feeling, feeling_data in clean_data(raw_data):
+		populate(feeling, feeling_data, data_objects)
+		feelings.append(feeling)
+
+	average_weights = _update_weights_batched(data_objects)
+
+	order_weights(feelings, average_weights)
+
+
+def _update_weights_batched(data_objects):
+	"""
+	Gives every Data object in data_objects its weights and average weight, like calling update_weights(find_weights(data_object.data)) on each one.  All of the data is weighted in one call, and the averages are then reduced per object by _average_weight_segments, so they can differ from update_average_weight in the last digit.  Each object's weights are a view into the shared array of weights.
+
+	Args:
+		data_objects (list): The Data objects to update.
+
+	Returns:
+		A list of the average weights, in the same order as data_objects.
+	"""
+
+	token_counts = np.array([data_object.data.count(" ") + 1 if data_object.data else 0 for data_object in data_objects], dtype=np.intp)
+	ends = np.cumsum(token_counts)
+	starts = ends - token_counts
 
-	for data_object in clean_data_objects:
-		data_object.update_weights(find_weights(data_object.data))
+	weights = _find_weights_fast(" ".join(data_object.data for data_object in data_objects if data_object.data))
+	average_weights = _average_weight_segments(weights, token_counts)
 
-	order_weights(clean_data_objects)
+	for data_object, start, end, average_weight in zip(data_objects, starts.tolist(), ends.tolist(), average_weights):
+		data_object.weights = weights[start:end]
+		data_object.average_weight = average_weight
+
+	return average_weights
+
+
+def _average_weight_segments(weights, token_counts):
+	"""
+	Averages consecutive segments of weights, ignoring NaN entries.  A segment with nothing to average has an average of 0.0.
+
+	Args:
+		weights (numpy.ndarray): The float64 weights of every segment, one after another.
+		token_counts (numpy.ndarray): The number of weights in each segment.
+
+	Returns:
+		A list of floats, one average per segment.
+	"""
+
+	starts = np.cumsum(token_counts) - token_counts
+	is_mapped = ~np.isnan(weights)
+
+	# reduceat can't reduce an empty segment, so empty segments are left at a sum and count of zero.
+	has_tokens = token_counts > 0
+	sums = np.zeros(len(token_counts))
+	counts = np.zeros(len(token_counts), dtype=np.intp)
+	if has_tokens.any():
+		sums[has_tokens] = np.add.reduceat(np.where(is_mapped, weights, 0.0), starts[has_tokens])
+		counts[has_tokens] = np.add.reduceat(is_mapped, starts[has_tokens], dtype=np.intp)
+
+	return np.divide(sums, counts, out=np.zeros(len(token_counts)), where=counts > 0).tolist()
 
 
 def get_data_from_file(file_to_read_from, delimiter, lower_index=0, upper_index=None):
 	"""
-	Specialty function to grab raw data from a file, split by a given delimeter between a certain index.  This is not a wholy safe function, and does not cleanly raise an error message for every input.
+	Specialty function to grab raw data from a file, split by a given delimeter between a certain index.  This is not a wholy safe function, and does not cleanly raise an error message for every input.  When upper_index is a non-negative bound and the delimiter has no line endings in it, the file is memory mapped, and only the chunks between the given indices are decoded.
 
 	Args:
 		file_to_read_from (str): The name of the file to open.
@@ -68,6 +139,15 @@ def get_data_from_file(file_to_read_from, delimiter, lower_index=0, upper_index=
 	Returns:
 		A string of raw data.
 
+		"\\r\\n" and lone "\\r" line endings are read as "\\n" before the data is split, the same as in text mode.
+
+		>>> import tempfile
+		>>> with tempfile.NamedTemporaryFile("wb", suffix=".dat", delete=False) as crlf_file:
+		...	_ = crlf_file.write(b"a\\r\\n---\\r\\nb\\r---\\rc")
+		>>> get_data_from_file(crlf_file.name, "\\n---\\n", 0, 2)
+		['a', 'b']
+		>>> os.remove(crlf_file.name)
+
 	Raises:
 		FileNotFoundError: Raises an exception if the file to read data from can not be found.
 
@@ -77,41 +157,76 @@ def get_data_from_file(file_to_read_from, delimiter, lower_index=0, upper_index=
 			...
 			...
 		FileNotFoundError: not-real-file.dat could not be found.
+
+		ValueError: Raises an exception if the delimiter is an empty string.
 	"""
 	if not os.path.isfile(file_to_read_from):
 		raise FileNotFoundError("{file_to_read_from} could not be found.".format(file_to_read_from=file_to_read_from))
 
-	with open(file_to_read_from, 'r') as data_file:
-		data = data_file.read().split(delimiter)
+	if not delimiter:
+		raise ValueError("The delimiter argument must not be empty.")
 
-		if upper_index is not None:
-			return data[lower_index:upper_index]
-		else:
-			return data[lower_index:len(data)]
+	with open(file_to_read_from, 'rb') as data_file:
+		# Negative or missing bounds mean every chunk has to be found anyway, and splitting the whole file at once is faster than walking it.  A delimiter with a line ending in it has to be searched for after line endings are normalised, which the raw bytes in the memory map aren't.
+		if upper_index is None or upper_index < 0 or (lower_index is not None and lower_index < 0) or "\n" in delimiter or "\r" in delimiter:
+			return _normalise_newlines(data_file.read().decode()).split(delimiter)[lower_index:upper_index]
+
+		if os.fstat(data_file.fileno()).st_size == 0:
+			return [""][lower_index:upper_index]
+
+		with mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+			separator = delimiter.encode()
+
+			# Only walk as far as the last wanted chunk.
+			spans = []
+			start = 0
+			while len(spans) < upper_index:
+				end = mapped_file.find(separator, start)
+				if end < 0:
+					spans.append((start, len(mapped_file)))
+					break
+
+				spans.append((start, end))
+				start = end + len(separator)
+
+			return [_normalise_newlines(mapped_file[start:end].decode()) for start, end in spans[lower_index:upper_index]]
+
+
+def _normalise_newlines(text):
+	"""
+	Converts "\r\n" and lone "\r" line endings to "\n", the same as reading the file in text mode would.
+	"""
+	if "\r" not in text:
+		return text
+
+	return text.replace("\r\n", "\n").replace("\r", "\n")
 
 
 def clean_data(raw_data):
 	"""
-	Attempts to clean given list of raw data and return a tuple of formatted data.  If expected errors are raised while trying to clean an element of data, the data is skipped and the next element is cleaned.
+	Attempts to clean given list of raw data and lazily yield tuples of formatted data.  If expected errors are raised while trying to clean an element of data, the data is skipped and the next element is cleaned.  The arguments are checked as soon as this is called, but each element is only cleaned when the caller asks for it.
 
 	Args:
 		raw_data (list): The data to attempt to clean.
 
 	Returns:
-		An array filled with tuples of the form (feeling, data_attached_to_feeling)
+		A generator of tuples of the form (feeling, data_attached_to_feeling)
 
-		>>> clean_data(["\nHow do you feel when you're at school? [Supported]\nOften\nAlways\nOften\nOften\nSometimes\nNever"])
+		>>> list(clean_data(["\nHow do you feel when you're at school? [Supported]\nOften\nAlways\nOften\nOften\nSometimes\nNever"]))
 		[('Supported', 'Often Always Often Often Sometimes Never')]
 
-		>>> clean_data(["\nHow do you feel when you're at school? [Bored]\nNever\nSometimes\nOften", "\nHow do you feel when you're at school? [Stressed]\nSometimes\nOften\nSometimes\nOften"])
+		>>> list(clean_data(["\nHow do you feel when you're at school? [Bored]\nNever\nSometimes\nOften", "\nHow do you feel when you're at school? [Stressed]\nSometimes\nOften\nSometimes\nOften"]))
 		[('Bored', 'Never Sometimes Often'), ('Stressed', 'Sometimes Often Sometimes Often')]
 
 		If the data can't be read, and an expected error message is raised, it will be passed for the next set of data.
 
-		>>> clean_data(["Timestamp\n3/12/2017 18:50:08\n", "\nHow do you feel when you're at school? [Tired]\nSometimes\nAlways\nSometimes\n"])
+		>>> list(clean_data(["Timestamp\n3/12/2017 18:50:08\n", "\nHow do you feel when you're at school? [Tired]\nSometimes\nAlways\nSometimes\n"]))
 		An error was raised when trying to extract a feeling from the input data.  This set of data will be skipped.  The error raised was: Subgroup must be less than the number of words in brackets in the dataset.  There were 0 word(s) matched, and the subgroup argument supplied was 0.
 		[('Tired', 'Sometimes Always Sometimes')]
 
+		>>> list(clean_data([]))
+		[]
+
 	Raises:
 		TypeError: Raises an exception if a raw_data isn't a list, or if the elements of raw_data aren't all strings.
 
@@ -136,23 +251,21 @@ def clean_data(raw_data):
 	if not all(isinstance(data, str) for data in raw_data):
 		raise TypeError("Argument given was a list, but not every element of that list was a string.")
 
-	cleaned_data_tuple = []
+	return _clean_records(raw_data)
+
+
+def _clean_records(raw_data):
+	"""
+	Yields a (feeling, data) tuple for every record in raw_data that can be parsed, printing a message for every record that is skipped.  No error-checking is done on raw_data itself; see clean_data.
+	"""
 
 	for data in raw_data:
 		try:
-			clean_feeling = extract_feeling(data)
-		except (TypeError, IndexError) as error:
-			print("An error was raised when trying to extract a feeling from the input data.  This set of data will be skipped.  The error raised was: {error}".format(error=error.with_traceback(sys.exc_info()[2])))
+			clean_feeling, cleaned_data = _parse_record(data)
+		except IndexError as error:
+			print(_SKIPPED_FEELING_MESSAGE + str(error))
 		else:
-			try:
-				cleaned_data = strip_data(data)
-			except TypeError as error:
-				print("An error was raised when trying to extract data from the input data.  This set of data will be skipped.  The error raised was: {error}".format(error=error.with_traceback(sys.exc_info()[2])))
-			else:
-				cleaned_data_tuple.append((clean_feeling, cleaned_data))
-
-	if cleaned_data_tuple:
-		return cleaned_data_tuple
+			yield clean_feeling, cleaned_data
 
 
 def extract_feeling(data, subgroup=0):
@@ -209,10 +322,38 @@ def extract_feeling(data, subgroup=0):
 	if not isinstance(data, str):
 		raise TypeError("{data} is of type {type}, not of type string.  This function only takes in a string as the data argument.".format(data=repr(data), type=type(data)))
 
+	return _extract_feeling_fast(data, subgroup)
+
+
+def _extract_feeling_fast(data, subgroup=0):
+	"""
+	The body of extract_feeling, without checking that data is a string.  Used by callers that already guarantee it.
+	"""
+
 	if subgroup < 0:
 		raise IndexError("Subgroup must be a positive number or zero.  A subgroup argument of {subgroup} was supplied.".format(subgroup=subgroup))
 
-	match = re.findall(r"\[(\w+)\]", data)
+	if "[" not in data:
+		raise IndexError("Subgroup must be less than the number of words in brackets in the dataset.  There were 0 word(s) matched, and the subgroup argument supplied was {subgroup}.".format(subgroup=subgroup))
+
+	if subgroup == 0:
+		left_bracket = data.find("[")
+		right_bracket = data.find("]", left_bracket + 1)
+
+		if left_bracket >= 0 and right_bracket > left_bracket:
+			candidate = data[left_bracket + 1:right_bracket]
+
+			if candidate.isascii() and (candidate.isidentifier() or candidate.isalnum()):
+				return candidate
+
+		first_match = _FEELING_RE.search(data)
+
+		if first_match is None:
+			raise IndexError("Subgroup must be less than the number of words in brackets in the dataset.  There were 0 word(s) matched, and the subgroup argument supplied was 0.")
+
+		return first_match.group(1)
+
+	match = _FEELING_RE.findall(data)
 	number_of_matches = len(match)
 
 	if subgroup >= number_of_matches:
@@ -254,22 +395,49 @@ def strip_data(raw_data):
 	if not isinstance(raw_data, str):
 		raise TypeError("{raw_data} is of type {type}, not of type string.  This function only takes in a string as an argument.".format(raw_data=repr(raw_data), type=type(raw_data)))
 
-	cleaned = raw_data.replace("\n", " ")
-	return cleaned[cleaned.find(']') + 1:].strip()
+	return raw_data[raw_data.find(']') + 1:].replace("\n", " ").strip()
+
+
+def _parse_record(data):
+	"""
+	Extracts the feeling and the stripped data from a single raw record in one pass.  This gives the same result as calling extract_feeling and strip_data on the record, but only scans the string for brackets once.
+
+	Args:
+		data (str): A raw record.  It is assumed to already be a string.
+
+	Returns:
+		A tuple of the form (feeling, stripped_data).
+
+	Raises:
+		IndexError: Raises an exception if there is no word in brackets in the record.
+	"""
+
+	left_bracket = data.find("[")
+	right_bracket = data.find("]")
+	feeling = None
 
+	if left_bracket >= 0 and right_bracket > left_bracket:
+		feeling = data[left_bracket + 1:right_bracket]
 
-def populate_dataset(feeling, feeling_data):
+	if not feeling or not feeling.isascii() or not (feeling.isidentifier() or feeling.isalnum()):
+		feeling = _extract_feeling_fast(data)
+
+	return feeling, data[right_bracket + 1:].replace("\n", " ").strip()
+
+
+def populate_dataset(feeling, feeling_data, store):
 	"""
-	Appends a Data object to cleaned_data_objects.
+	Appends a Data object to store.
 
 	Args:
 		feeling (str): A string to use for the feeling perameter of the Data object.
 		feeling_data (str): A string to use for the data parameter of the Data object.
+		store (list): The list to append the Data object to.
 
 	Raises:
 		TypeError: Raises an exception if either one of the arguments supplied isn't a string.
 
-		>>> populate_dataset("Logistical", 4.6692)
+		>>> populate_dataset("Logistical", 4.6692, [])
 		Traceback (most recent call last):
 			...
 			...
@@ -280,24 +448,37 @@ def populate_dataset(feeling, feeling_data):
 	if not isinstance(feeling, str) or not isinstance(feeling_data, str):
 		raise TypeError("Feeling argument supplied was of type {feeling_type}, and feeling_data argument supplied was of type {data_type}.  They must both be of type string.".format(feeling_type=type(feeling), data_type=type(feeling_data)))
 
-	clean_data_objects.append(Data(feeling, feeling_data))
+	_populate_dataset_fast(feeling, feeling_data, store)
+
+
+def _populate_dataset_fast(feeling, feeling_data, store):
+	"""
+	The body of populate_dataset, without checking that both arguments are strings.  Used by callers that already guarantee it.
+	"""
+
+	store.append(Data(feeling, feeling_data))
 
 
 def find_weights(data):
 	"""
-	Returns a list of number of range 0-1, mapping every "Never" to 0, every "Sometimes" to 1/3, every "Often" to 2/3, and every "Always" to 1.  Words with no mapping value will be mapped to None.
+	Returns an array of numbers of range 0-1, mapping every "Never" to 0, every "Sometimes" to 1/3, every "Often" to 2/3, and every "Always" to 1.  Words with no mapping value will be mapped to NaN.
 
 	Args:
 		data (str): A string to map from.
 
 	Returns:
-		A new list with values mapped.  If there are occurances of words which have no mapping, they are replaced with None.
+		A new numpy.ndarray with values mapped.  If there are occurances of words which have no mapping, they are replaced with NaN.
 
 		>>> find_weights("Never Always Often")
-		[0, 1, 0.6666666666666666]
+		array([0.        , 1.        , 0.66666667])
 
 		>>> find_weights("Always Never The Velvet Undergound Syzygy Mandelbrot Never")
-		[1, 0, None, None, None, None, None, 0]
+		array([ 1.,  0., nan, nan, nan, nan, nan,  0.])
+
+		An empty string has no weights.
+
+		>>> find_weights("")
+		array([], dtype=float64)
 
 	Raises:
 		TypeError: Raises an exception if something other than a string is supplied as the argument.
@@ -313,28 +494,101 @@ def find_weights(data):
 	if not isinstance(data, str):
 		raise TypeError("Data argument supplied was of type {data_type}, it must be of type string.".format(data_type=type(data)))
 
-	weight_for_time_interval = {"Never": 0, "Sometimes": 1 / 3, "Often": 2 / 3, "Always": 1}
+	return _find_weights_fast(data)
 
-	weights = []
-	for time_interval in data.split(" "):
-		if time_interval in weight_for_time_interval:
-			weights.append(weight_for_time_interval[time_interval])
-		else:
-			weights.append(None)
+
+def _find_weights_fast(data):
+	"""
+	The body of find_weights, without checking that data is a string.  Used by callers that already guarantee it.
+	"""
+
+	if not data:
+		return np.empty(0)
+
+	if _classify_time_intervals is not None:
+		weights = np.empty(data.count(" ") + 1)
+		_classify_time_intervals(np.frombuffer(data.encode(), dtype=np.uint8), weights)
+		return weights
+
+	weight_for_time_interval = _WEIGHT_FOR_TIME_INTERVAL.get
+
+	time_intervals = data.split(" ")
+	weights = np.full(len(time_intervals), np.nan)
+
+	for index, time_interval in enumerate(time_intervals):
+		weight = weight_for_time_interval(time_interval)
+		if weight is not None:
+			weights[index] = weight
 
 	return weights
 
 
-def order_weights(data_objects):
-	weights = []
+def _token_equals(buffer, start, word_start, length):
+	"""
+	Checks whether buffer[start:start + length] holds the same bytes as _WORD_BYTES[word_start:word_start + length].
+	"""
+	for offset in range(length):
+		if buffer[start + offset] != _WORD_BYTES[word_start + offset]:
+			return False
+
+	return True
+
+
+def _classify_time_intervals(buffer, weights):
+	"""
+	Scans a buffer of encoded bytes for space separated time intervals, and writes the weight of each one into weights.  The first byte of each token picks the only word it could be from _WORD_FOR_FIRST_BYTE, and the rest of the token is then checked against that word.  Words with no mapping value are written as NaN.  weights must have one slot per token, i.e. one more than the number of spaces in buffer.
+
+	Args:
+		buffer (numpy.ndarray): The uint8 view of the encoded data.
+		weights (numpy.ndarray): The float64 array to write the weights into.
+	"""
+	token = 0
+	start = 0
 
-	for data_object in data_objects:
-		weights.append((data_object.feeling, data_object.average_weight))
+	for position in range(buffer.size + 1):
+		if position < buffer.size and buffer[position] != 32:
+			continue
 
-	weights.sort(key=itemgetter(1), reverse=True)
+		length = position - start
+		word = _WORD_FOR_FIRST_BYTE[buffer[start]] if length > 0 else -1
+
+		if word >= 0 and length == _WORD_LENGTHS[word] and _token_equals(buffer, start, _WORD_STARTS[word], length):
+			weights[token] = _WORD_WEIGHTS[word]
+		else:
+			weights[token] = np.nan
+
+		token += 1
+		start = position + 1
+
+
+if njit is not None:
+	# Compiling against an explicit signature at import time means the first call to _find_weights_fast doesn't pay for it.
+	_token_equals = njit(cache=True)(_token_equals)
+	_classify_time_intervals = njit(types.void(types.Array(types.uint8, 1, "C", readonly=True), types.float64[::1]), cache=True)(_classify_time_intervals)
+else:
+	_classify_time_intervals = None
+
+
+def order_weights(feelings, average_weights, top_k=None):
+	"""
+	Prints every feeling alongside its average weight, from the highest average weight to the lowest.  Feelings with equal average weights are printed in the order they were given.
+
+	Args:
+		feelings (list): The feelings to print.
+		average_weights (list): The average weight of each feeling, in the same order as feelings.
+		top_k (int): If supplied, only the top_k feelings with the highest average weights are printed.  Defaults to None.  I.e. print every feeling.
+
+		>>> order_weights(["Bored", "Tired", "Joyful"], [0.25, 0.75, 0.5], top_k=2)
+		Tired 0.75
+		Joyful 0.5
+	"""
+	if top_k is not None:
+		order = heapq.nlargest(top_k, range(len(average_weights)), key=average_weights.__getitem__)
+	else:
+		order = np.argsort(-np.asarray(average_weights, dtype=float), kind="stable")
 
-	for element in weights:
-		print(element[0], element[1])
+	for index in order:
+		print(feelings[index], average_weights[index])
 
 
 if __name__ == "__main__":